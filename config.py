@@ -5,8 +5,8 @@ load_dotenv()
 
 class Config:
     # Flask
-    FLASK_ENV = 'development'
-    DEBUG = True
+    FLASK_ENV = os.getenv('FLASK_ENV', 'development')
+    DEBUG = FLASK_ENV == 'development'
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-prod')
     
     # LLM API Keys
@@ -16,14 +16,63 @@ class Config:
     YOUTUBE_TRANSCRIPT_IO_API_KEY = os.getenv('YOUTUBE_TRANSCRIPT_IO_API_KEY')
     
     # Model Settings
-    SUMMARIZATION_MODEL = 'google'  # 'google', 'openai' or 'ollama' etc
+    SUMMARIZATION_MODEL = 'google'  # 'google', 'openai' or 'local' (local summaries, LOCAL_SUMMARY_FALLBACK quizzes)
+    GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')  # e.g. 'gemini-2.5-flash-lite'
+    OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
     MAX_SUMMARY_LENGTH = 200000
     NUM_QUIZ_QUESTIONS = 5
+    SUMMARY_MAX_CONCURRENCY = 8  # in-flight LLM calls per summarize_many
+    FUSED_SUMMARY_QUIZ = True  # one LLM call for summary + quiz instead of two; ignored for 'local'
+    SUMMARY_CHUNK_CHARS = 16000  # longer input (after the token budget) is summarized map-reduce; 0 disables
+    
+    # Local summarizer (model_type='local'): short content on CPU, remote model otherwise
+    LOCAL_SUMMARY_MODEL = os.getenv('LOCAL_SUMMARY_MODEL', 'sshleifer/distilbart-cnn-12-6')
+    LOCAL_SUMMARY_MAX_CHARS = 4000
+    LOCAL_SUMMARY_FALLBACK = 'google'  # used for long content or a failed quality check
+    LOCAL_SUMMARY_MIN_WORDS = 40
+    LOCAL_SUMMARY_MIN_COVERAGE = 0.8  # share of summary words that must appear in the source
+    # torch threads per worker; the default splits the cores between gunicorn.conf.py's workers
+    LOCAL_SUMMARY_THREADS = int(os.getenv(
+        'LOCAL_SUMMARY_THREADS',
+        max(1, (os.cpu_count() or 1) // int(os.getenv('WEB_CONCURRENCY', min(os.cpu_count() or 1, 4))))
+    ))
+    
+    # LLM input budgets (characters), applied once per request
+    MAX_SUMMARY_INPUT = 300000
+    # ...then trimmed to a token budget by the summarizer
+    SUMMARY_MAX_INPUT_TOKENS = 30000  # Gemini
+    OPENAI_SUMMARY_MAX_INPUT_TOKENS = 2000
+    SUMMARY_BATCH_MAX_TOKENS = 8000  # per summarize_batch call (OpenAI)
+    SUMMARY_BATCH_MAX_SIZE = 16  # documents per summarize_batch call; 300 output tokens each
+    MAX_QUIZ_SUMMARY = 1000
+    MAX_QUIZ_CONTENT = 2000
+    
+    # Quiz micro-batching
+    QUIZ_BATCH_WINDOW_MS = 50
+    QUIZ_BATCH_MAX_SIZE = 8
     
     # Web Scraping
     REQUEST_TIMEOUT = 10
+    HTTP_MAX_CONNECTIONS = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = 50
+    TRANSCRIPT_API_TIMEOUT = 30
+    TRANSCRIPT_BATCH_WINDOW_MS = 30
+    TRANSCRIPT_BATCH_MAX_SIZE = 10
     MAX_CONTENT_LENGTH = 100000
     
+    # Caching
+    REDIS_URL = os.getenv('REDIS_URL')  # optional second tier behind the in-memory LRU
+    LLM_CACHE_DIR = 'cache/llm'  # persistent second tier when REDIS_URL is unset
+    LLM_CACHE_SIZE_LIMIT = 512 * 1024 * 1024
+    CACHE_TTL = 24 * 60 * 60
+    CACHE_MAX_ENTRIES = 1024
+    ARTICLE_CACHE_DIR = 'cache/articles'
+    ARTICLE_CACHE_TTL = 24 * 60 * 60
+    ARTICLE_CACHE_SIZE_LIMIT = 256 * 1024 * 1024
+    SEMANTIC_CACHE_ENABLED = True
+    SEMANTIC_CACHE_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+    SEMANTIC_CACHE_THRESHOLD = 0.92
+    
     # Guardrails
     MIN_SUMMARY_LENGTH = 100
     MAX_SUMMARY_LENGTH = 200000
@@ -0,0 +1,9 @@
+import multiprocessing
+import os
+
+# Production server: gunicorn main:app
+# Quart is ASGI, so each worker runs an event loop that overlaps many requests' network waits
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+worker_class = 'uvicorn.workers.UvicornWorker'
+timeout = 120  # summarization + quiz generation can take tens of seconds
@@ -1,43 +1,99 @@
-from flask import Flask, render_template, request, jsonify
+from quart import Quart, render_template, request, jsonify
+from quart.json.provider import DefaultJSONProvider
+import atexit
 import logging
-import json
+import orjson
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from config import config
 from modules.scraper import WebScraper
 from modules.summarizer import LLMSummarizer
-from modules.quiz_generator import QuizGenerator
+from modules.quiz_generator import BatchingQuizGenerator
+from modules.summarizer_quiz import SummaryQuizGenerator
 from modules.guardrails import ContentGuardrails
+from modules.cache import SemanticCache
+from modules.clients import close_openai_client
 
-# Configure logging
+# Configure logging: request handlers only enqueue records,
+# a background listener thread does the file and console writes
+log_queue = queue.Queue(-1)
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler = logging.FileHandler('logs/app.log')
+stream_handler = logging.StreamHandler()
+for handler in (file_handler, stream_handler):
+    handler.setFormatter(log_formatter)
+
+log_listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+# Records are formatted once, by the listener's handlers; the queue side passes the bare message
+queue_handler = QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/app.log'),
-        logging.StreamHandler()
-    ]
+    handlers=[queue_handler]
 )
 
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson for request parsing and responses"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app = Quart(__name__)
+app.json = OrjsonProvider(app)
 app.config.from_object(config)
 
 # Initialize modules
 scraper = WebScraper()
+# 'local' only summarizes: quizzes use its remote fallback, and the two-step path
+# runs so the local summarizer actually sees the content
+quiz_model = config.LOCAL_SUMMARY_FALLBACK if config.SUMMARIZATION_MODEL == 'local' else config.SUMMARIZATION_MODEL
+use_fused = config.FUSED_SUMMARY_QUIZ and config.SUMMARIZATION_MODEL != 'local'
 summarizer = LLMSummarizer(model_type=config.SUMMARIZATION_MODEL)
-quiz_generator = QuizGenerator(model_type=config.SUMMARIZATION_MODEL)
+quiz_generator = BatchingQuizGenerator(
+    model_type=quiz_model,
+    window_ms=config.QUIZ_BATCH_WINDOW_MS,
+    max_batch_size=config.QUIZ_BATCH_MAX_SIZE
+)
+summary_quiz_generator = SummaryQuizGenerator(model_type=quiz_model)
 guardrails = ContentGuardrails()
+semantic_cache = SemanticCache(
+    config.SEMANTIC_CACHE_MODEL,
+    threshold=config.SEMANTIC_CACHE_THRESHOLD,
+    max_entries=config.CACHE_MAX_ENTRIES
+) if config.SEMANTIC_CACHE_ENABLED else None
+# Semantic hits are only reused for the model and quiz settings that produced them
+semantic_scope = '|'.join(str(part) for part in (
+    summarizer.model_name,
+    quiz_generator.model_name,
+    summary_quiz_generator.model_name,
+    config.NUM_QUIZ_QUESTIONS,
+    use_fused
+))
+
+@app.after_serving
+async def shutdown():
+    """Close the shared HTTP clients"""
+    await WebScraper.close_client()
+    await close_openai_client()
 
 @app.route('/')
-def index():
+async def index():
     """Home page"""
-    return render_template('index.html')
+    return await render_template('index.html')
 
 @app.route('/api/process-url', methods=['POST'])
-def process_url():
+async def process_url():
     """Process URL: scrape -> summarize -> generate quiz"""
     try:
-        data = request.get_json()
+        data = await request.get_json()
         url = data.get('url', '').strip()
         
         # Validate URL
@@ -51,7 +107,7 @@ def process_url():
         logger.info(f"Processing URL: {url}")
         
         # Step 1: Extract content
-        extraction_result = scraper.extract_content(url)
+        extraction_result = await scraper.extract_content(url)
         if extraction_result['status'] != 'success':
             return jsonify(extraction_result), 400
         
@@ -61,27 +117,63 @@ def process_url():
         
         logger.info(f"Content extracted. Type: {content_type}, Length: {len(content)}")
         
-        # Step 2: Generate summary
-        summary_result = summarizer.summarize(content)
-        if summary_result['status'] != 'success':
-            return jsonify(summary_result), 500
+        # Reuse results from a near-identical page if we have one
+        if semantic_cache:
+            cached = await semantic_cache.lookup(title, content, semantic_scope)
+            if cached:
+                return jsonify({
+                    'status': 'success',
+                    'data': {
+                        'title': title,
+                        'content_type': content_type,
+                        'summary': cached['summary'],
+                        'quiz': cached['quiz'],
+                        'url': url
+                    }
+                }), 200
         
-        summary = summary_result['summary']
+        # Bound LLM inputs once so every stage (and its cache key) sees the same text
+        summary_input = content[:config.MAX_SUMMARY_INPUT]
+        quiz_content = content[:config.MAX_QUIZ_CONTENT]
         
-        # Validate summary
-        is_valid, msg = guardrails.validate_summary(summary)
-        if not is_valid:
-            logger.warning(f"Summary validation failed: {msg}")
-            return jsonify({'status': 'error', 'message': msg}), 400
-        
-        logger.info(f"Summary generated. Length: {len(summary)}")
-        
-        # Step 3: Generate quiz
-        quiz_result = quiz_generator.generate(summary, content)
-        if quiz_result['status'] != 'success':
-            return jsonify(quiz_result), 500
-        
-        quiz = quiz_result['quiz']
+        if use_fused:
+            # Steps 2 + 3: Generate summary and quiz in a single LLM call
+            combined_result = await summary_quiz_generator.generate_both(summary_input)
+            if combined_result['status'] != 'success':
+                return jsonify(combined_result), 500
+            
+            summary = combined_result['summary']
+            quiz = combined_result['quiz']
+            
+            # Validate summary
+            is_valid, msg = guardrails.validate_summary(summary)
+            if not is_valid:
+                logger.warning(f"Summary validation failed: {msg}")
+                return jsonify({'status': 'error', 'message': msg}), 400
+            
+            logger.info(f"Summary generated. Length: {len(summary)}")
+        else:
+            # Step 2: Generate summary
+            summary_result = await summarizer.summarize(summary_input)
+            if summary_result['status'] != 'success':
+                return jsonify(summary_result), 500
+            
+            summary = summary_result['summary']
+            
+            # Validate summary
+            is_valid, msg = guardrails.validate_summary(summary)
+            if not is_valid:
+                logger.warning(f"Summary validation failed: {msg}")
+                return jsonify({'status': 'error', 'message': msg}), 400
+            
+            logger.info(f"Summary generated. Length: {len(summary)}")
+            
+            # Step 3: Generate quiz
+            quiz_result = await quiz_generator.generate(summary[:config.MAX_QUIZ_SUMMARY], quiz_content)
+            if quiz_result['status'] != 'success':
+                return jsonify(quiz_result), 500
+            
+            quiz = quiz_result['quiz']
         
         # Validate quiz
         is_valid, msg = guardrails.validate_quiz(quiz)
@@ -90,6 +182,10 @@ def process_url():
         
         logger.info(f"Quiz generated with {len(quiz)} questions")
         
+        if semantic_cache:
+            # Embedding happens after the response is sent
+            app.add_background_task(semantic_cache.store, title, content, {'summary': summary, 'quiz': quiz}, semantic_scope)
+        
         return jsonify({
             'status': 'success',
             'data': {
@@ -106,19 +202,20 @@ def process_url():
         return jsonify({'status': 'error', 'message': 'Internal server error'}), 500
 
 @app.route('/api/health', methods=['GET'])
-def health():
+async def health():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'service': 'URL Summarization & Quiz App'}), 200
 
 @app.errorhandler(404)
-def not_found(error):
+async def not_found(error):
     return jsonify({'status': 'error', 'message': 'Endpoint not found'}), 404
 
 @app.errorhandler(500)
-def internal_error(error):
+async def internal_error(error):
     logger.error(f"Internal server error: {str(error)}")
     return jsonify({'status': 'error', 'message': 'Internal server error'}), 500
 
 if __name__ == '__main__':
-    logger.info("Starting Flask application")
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Local development only; run production with `gunicorn main:app` (see gunicorn.conf.py)
+    logger.info("Starting Quart application")
+    app.run(debug=config.DEBUG, host='0.0.0.0', port=5000)
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """
+    Collects items submitted within a short window (or until max_batch_size)
+    and passes them to handler(items) as one batch. The handler returns one
+    result per item, in order; a result that is an exception is raised to
+    that item's caller, and an exception from the handler goes to every caller.
+    """
+
+    def __init__(self, handler, window_ms=50, max_batch_size=8):
+        self.handler = handler
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue = None
+        self._worker = None
+        self._tasks = set()
+
+    async def submit(self, item):
+        """Queue item and wait for its result from the batch it lands in"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._drain_queue())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _drain_queue(self):
+        """Background task: group queued items into batches"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Run the batch in its own task so the next window can start collecting
+            task = asyncio.create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch):
+        """Resolve every future in the batch with its own result"""
+        try:
+            results = list(await self.handler([item for item, _ in batch]))
+            if len(results) != len(batch):
+                raise ValueError(f"Batch handler returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            logger.error(f"Error in batch of {len(batch)}: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,322 @@
+import asyncio
+import functools
+import hashlib
+import orjson
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from config import config
+
+logger = logging.getLogger(__name__)
+
+class LLMCache:
+    """
+    Two-tier LLM response cache: in-memory LRU in front of a persistent tier,
+    Redis when configured, otherwise a size-capped on-disk LRU
+    """
+
+    def __init__(self, max_entries=1024, ttl=86400, redis_url=None, disk_dir=None, disk_size_limit=2**29):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = OrderedDict()
+        self._redis = None
+        self._disk = None
+
+        if redis_url:
+            try:
+                import redis.asyncio as redis
+                self._redis = redis.from_url(redis_url)
+            except ImportError:
+                logger.warning("redis package not installed, using in-memory cache only")
+        elif disk_dir:
+            try:
+                import diskcache
+                self._disk = diskcache.Cache(
+                    disk_dir,
+                    eviction_policy='least-recently-used',
+                    size_limit=disk_size_limit
+                )
+            except ImportError:
+                logger.warning("diskcache package not installed, using in-memory cache only")
+
+    @staticmethod
+    def make_key(namespace, *parts):
+        """Build a cache key from the namespace and the inputs that determine the output"""
+        # Feed the parts straight into the hash rather than joining them into one more copy of the content
+        digest = hashlib.blake2b(digest_size=16)
+        for i, part in enumerate(parts):
+            if i:
+                digest.update(b'|')
+            digest.update(str(part).encode('utf-8'))
+        return f"llm:{namespace}:{digest.hexdigest()}"
+
+    def _remember(self, key, value):
+        self._local[key] = value
+        self._local.move_to_end(key)
+        if len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def _persistent_get(self, key):
+        if self._redis is not None:
+            return await self._redis.get(key)
+        if self._disk is not None:
+            return await asyncio.to_thread(self._disk.get, key)
+        return None
+
+    async def _persistent_set(self, key, raw):
+        if self._redis is not None:
+            await self._redis.setex(key, self.ttl, raw)
+        elif self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, raw, expire=self.ttl)
+
+    async def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        if key in self._local:
+            self._local.move_to_end(key)
+            return self._local[key]
+
+        try:
+            raw = await self._persistent_get(key)
+        except Exception as e:
+            logger.warning(f"Cache get failed: {str(e)}")
+            return None
+
+        if raw is None:
+            return None
+
+        value = orjson.loads(raw)
+        self._remember(key, value)
+        return value
+
+    async def set(self, key, value):
+        """Store value in both tiers"""
+        self._remember(key, value)
+
+        try:
+            await self._persistent_set(key, orjson.dumps(value))
+        except Exception as e:
+            logger.warning(f"Cache set failed: {str(e)}")
+
+
+class SemanticCache:
+    """
+    Reuses pipeline results for repeated and near-duplicate pages.
+    Identical content is matched by hash; otherwise pages are compared by embedding
+    a sample of the title and text from the start, middle and end (so a shared site
+    header cannot dominate), and hits also require a similar content length and the
+    same scope: the model and quiz settings that produced the result.
+    """
+
+    def __init__(self, model_name, threshold=0.92, max_entries=1024, max_length_ratio=1.2):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_length_ratio = max_length_ratio
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._entries = []  # list of (scope, content digest, content length, normalized vector, result)
+
+    @staticmethod
+    def _digest(content):
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+
+    @staticmethod
+    def _signature(title, content, sample=300):
+        middle = max(0, len(content) // 2 - sample // 2)
+        return f"{title}\n{content[:sample]}\n{content[middle:middle + sample]}\n{content[-sample:]}"
+
+    def _embed(self, text):
+        with self._model_lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+        return self._model.encode(text, normalize_embeddings=True)
+
+    async def _embed_page(self, title, content):
+        try:
+            return await asyncio.to_thread(self._embed, self._signature(title, content))
+        except Exception as e:
+            logger.warning(f"Semantic cache embedding failed: {str(e)}")
+            return None
+
+    def _similar_length(self, a, b):
+        return max(a, b) <= min(a, b) * self.max_length_ratio
+
+    async def lookup(self, title, content, scope=''):
+        """Return the result stored for the same or most similar page in the same scope, or None"""
+        digest = self._digest(content)
+        candidates = []
+        for entry_scope, entry_digest, length, vector, result in self._entries:
+            if entry_scope != scope:
+                continue
+            if entry_digest == digest:
+                logger.info("Semantic cache hit (identical content)")
+                return result
+            if vector is not None and self._similar_length(length, len(content)):
+                candidates.append((vector, result))
+        if not candidates:
+            return None
+
+        vector = await self._embed_page(title, content)
+        if vector is None:
+            return None
+
+        best_score, best_result = 0.0, None
+        for stored, result in candidates:
+            score = float(vector @ stored)
+            if score > best_score:
+                best_score, best_result = score, result
+
+        if best_score >= self.threshold:
+            logger.info(f"Semantic cache hit (cosine {best_score:.3f})")
+            return best_result
+        return None
+
+    async def store(self, title, content, result, scope=''):
+        """Remember result for this page; without an embedding it can still be matched exactly"""
+        vector = await self._embed_page(title, content)
+        self._entries.append((scope, self._digest(content), len(content), vector, result))
+        if len(self._entries) > self.max_entries:
+            self._entries.pop(0)
+
+
+class ArticleCache:
+    """
+    On-disk cache of extracted page content, one JSON file per source.
+    Expired entries are deleted, and the oldest go first once the directory is over its size limit.
+    """
+
+    def __init__(self, directory, ttl=86400, size_limit=2**28, prune_interval=300):
+        self.directory = directory
+        self.ttl = ttl
+        self.size_limit = size_limit
+        self.prune_interval = prune_interval
+        self._last_prune = 0.0
+
+    def _path(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+
+        if time.time() - entry.get('fetched_at', 0) > self.ttl:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def _write(self, key, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        # Unique temp name so concurrent writers of the same key never share a file
+        with tempfile.NamedTemporaryFile('wb', dir=self.directory, suffix='.tmp', delete=False) as f:
+            f.write(orjson.dumps(entry))
+        os.replace(f.name, self._path(key))
+
+        if time.time() - self._last_prune > self.prune_interval:
+            self._last_prune = time.time()
+            self._prune()
+
+    def _prune(self):
+        """Delete expired entries (and stale temp files), then the oldest until under the size limit"""
+        now = time.time()
+        entries = []
+        with os.scandir(self.directory) as it:
+            for item in it:
+                try:
+                    stat = item.stat()
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.ttl:
+                    try:
+                        os.remove(item.path)
+                    except OSError:
+                        pass
+                elif item.name.endswith('.json'):
+                    entries.append((stat.st_mtime, stat.st_size, item.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.size_limit:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    async def get(self, key):
+        """Return the cached {title, content, type, fetched_at} for key, or None"""
+        return await asyncio.to_thread(self._read, key)
+
+    async def set(self, key, title, content, content_type):
+        """Write an extraction result through to disk"""
+        entry = {
+            'title': title,
+            'content': content,
+            'type': content_type,
+            'fetched_at': time.time()
+        }
+        try:
+            await asyncio.to_thread(self._write, key, entry)
+        except OSError as e:
+            logger.warning(f"Article cache write failed: {str(e)}")
+
+
+def llm_cache_key(namespace, owner, *args):
+    """The key CachedLLM uses for one of owner's methods called with args"""
+    return LLMCache.make_key(
+        namespace,
+        owner.model_type,
+        getattr(owner, 'model_name', ''),
+        *(str(arg).strip() for arg in args),
+        getattr(owner, 'num_questions', '')
+    )
+
+
+def CachedLLM(namespace):
+    """
+    Cache successful results of an async LLM method.
+    The key covers the provider and model, every positional input and num_questions (if set).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args):
+            key = llm_cache_key(namespace, self, *args)
+
+            cached = await llm_cache.get(key)
+            if cached is not None:
+                logger.info(f"LLM cache hit for {namespace}")
+                return cached
+
+            result = await func(self, *args)
+            if result.get('status') == 'success':
+                await llm_cache.set(key, result)
+            return result
+        return wrapper
+    return decorator
+
+
+llm_cache = LLMCache(
+    max_entries=config.CACHE_MAX_ENTRIES,
+    ttl=config.CACHE_TTL,
+    redis_url=config.REDIS_URL,
+    disk_dir=config.LLM_CACHE_DIR,
+    disk_size_limit=config.LLM_CACHE_SIZE_LIMIT
+)
+
+article_cache = ArticleCache(
+    config.ARTICLE_CACHE_DIR,
+    ttl=config.ARTICLE_CACHE_TTL,
+    size_limit=config.ARTICLE_CACHE_SIZE_LIMIT
+)
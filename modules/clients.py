@@ -0,0 +1,27 @@
+from functools import lru_cache
+from config import config
+
+@lru_cache(maxsize=1)
+def get_openai_client():
+    """
+    Process-wide AsyncOpenAI client. Summarizer, quiz and combined generators share
+    one pooled HTTP/2 connection stack instead of each opening their own.
+    """
+    import httpx
+    from openai import AsyncOpenAI
+    
+    http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS
+        )
+    )
+    # Retries are tenacity's job (llm_retry); SDK retries on top would multiply billed attempts
+    return AsyncOpenAI(api_key=config.OPENAI_API_KEY, http_client=http_client, max_retries=0)
+
+async def close_openai_client():
+    """Close the shared client (and its connection pool) if it was ever created"""
+    if get_openai_client.cache_info().currsize:
+        await get_openai_client().close()
+        get_openai_client.cache_clear()
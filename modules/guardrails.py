@@ -1,8 +1,20 @@
 import logging
+import re
 from config import config
 
 logger = logging.getLogger(__name__)
 
+# Harmful content patterns (simple checks), matched in a single case-insensitive pass
+FORBIDDEN_PATTERNS = [
+    'violence', 'hate', 'adult content', 'explicit',
+    'drugs', 'weapons', 'illegal'
+]
+FORBIDDEN_RE = re.compile('|'.join(map(re.escape, FORBIDDEN_PATTERNS)), re.IGNORECASE)
+
+# Script-capable URL protocols, matched the same way
+DANGEROUS_PROTOCOLS = ['javascript:', 'data:', 'vbscript:']
+DANGEROUS_PROTOCOL_RE = re.compile('|'.join(map(re.escape, DANGEROUS_PROTOCOLS)), re.IGNORECASE)
+
 class ContentGuardrails:
     """Validates content safety and quality"""
     
@@ -19,15 +31,10 @@ class ContentGuardrails:
             return False, f"Summary too long (max {config.MAX_SUMMARY_LENGTH} chars)"
         
         # Check for harmful content patterns (simple checks)
-        forbidden_patterns = [
-            'violence', 'hate', 'adult content', 'explicit',
-            'drugs', 'weapons', 'illegal'
-        ]
-        summary_lower = summary.lower()
-        for pattern in forbidden_patterns:
-            if pattern in summary_lower:
-                logger.warning(f"Potentially harmful content detected: {pattern}")
-                return False, "Content contains inappropriate material"
+        match = FORBIDDEN_RE.search(summary)
+        if match:
+            logger.warning(f"Potentially harmful content detected: {match.group(0).lower()}")
+            return False, "Content contains inappropriate material"
         
         return True, "Summary passed validation"
     
@@ -58,11 +65,7 @@ class ContentGuardrails:
     @staticmethod
     def validate_url(url):
         """Validate URL safety"""
-        dangerous_protocols = ['javascript:', 'data:', 'vbscript:']
-        url_lower = url.lower()
-        
-        for protocol in dangerous_protocols:
-            if protocol in url_lower:
-                return False, f"Unsafe URL protocol detected"
+        if DANGEROUS_PROTOCOL_RE.search(url):
+            return False, f"Unsafe URL protocol detected"
         
         return True, "URL is safe"
@@ -1,88 +1,145 @@
-import google.generativeai as genai
-from openai import OpenAI
-import json
+import asyncio
+import orjson
 import logging
+from typing import get_args, get_origin
+from typing_extensions import TypedDict, get_type_hints, is_typeddict
 from config import config
+from modules.batching import MicroBatcher
+from modules.cache import CachedLLM
+from modules.clients import get_openai_client
+from modules.summarizer import llm_retry
 
 logger = logging.getLogger(__name__)
 
+class QuizQuestion(TypedDict):
+    """Structured-output schema for one quiz question"""
+    id: int
+    question: str
+    type: str  # 'multiple_choice', 'true_false' or 'fill_blank'
+    options: list[str]  # empty unless multiple_choice
+    correct_answer: str  # 'true'/'false' for true_false
+    explanation: str
+
+class QuizResponse(TypedDict):
+    """Structured-output schema for a single quiz"""
+    questions: list[QuizQuestion]
+
+class BatchedQuiz(TypedDict):
+    """One document's slot in a batched quiz response"""
+    index: int
+    questions: list[QuizQuestion]
+
+class BatchedQuizResponse(TypedDict):
+    """Structured-output schema for a batched quiz"""
+    quizzes: list[BatchedQuiz]
+
+def _json_schema(tp):
+    """JSON schema for a TypedDict schema, in the strict form OpenAI structured outputs require"""
+    if is_typeddict(tp):
+        hints = get_type_hints(tp)
+        return {
+            'type': 'object',
+            'properties': {name: _json_schema(hint) for name, hint in hints.items()},
+            'required': list(hints),
+            'additionalProperties': False
+        }
+    if get_origin(tp) is list:
+        return {'type': 'array', 'items': _json_schema(get_args(tp)[0])}
+    return {'type': {str: 'string', int: 'integer', float: 'number', bool: 'boolean'}[tp]}
+
+def openai_response_format(name, schema):
+    """OpenAI response_format enforcing the same TypedDict schema Gemini gets as response_schema"""
+    return {
+        'type': 'json_schema',
+        'json_schema': {
+            'name': name,
+            'strict': True,
+            'schema': _json_schema(schema)
+        }
+    }
+
+# Static instructions, sent as the system prompt so the provider can cache the prefix;
+# only the summary and content change between calls
+QUIZ_INSTRUCTIONS = """You are an expert quiz generator for educational content.
+For each document you are given, generate {num_questions} educational quiz questions.
+Use the SUMMARY for context and ground the questions in the SOURCE CONTENT.
+
+Return ONLY valid JSON. For a single document use {{"questions": [...]}}, where each question looks like one of:
+{{"id": 1, "question": "Question text here?", "type": "multiple_choice", "options": ["Option A", "Option B", "Option C", "Option D"], "correct_answer": "Option A", "explanation": "Why this answer is correct based on the content"}}
+{{"id": 2, "question": "True or False statement", "type": "true_false", "options": [], "correct_answer": "true", "explanation": "Explanation"}}
+{{"id": 3, "question": "Fill in the blank: The capital of France is _____", "type": "fill_blank", "options": [], "correct_answer": "Paris", "explanation": "From the content"}}
+"""
+
 class QuizGenerator:
     """Generates interactive quizzes using RAG + LLM"""
     
-    def __init__(self, model_type='google'):
+    def __init__(self, model_type='google', model_name=None):
         self.model_type = model_type
+        self.model_name = model_name or (config.GEMINI_MODEL if model_type == 'google' else config.OPENAI_MODEL)
         self.num_questions = config.NUM_QUIZ_QUESTIONS
+        self.instructions = QUIZ_INSTRUCTIONS.format(num_questions=self.num_questions)
         
+        # Provider SDKs are heavy; import only the one in use
         if model_type == 'google':
+            import google.generativeai as genai
             genai.configure(api_key=config.GOOGLE_API_KEY)
             # ✅ FIXED: Using gemini-2.5-flash instead of deprecated gemini-pro
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
+            # JSON mode + schema guarantees parseable output, no markdown to strip
+            self.model = genai.GenerativeModel(
+                self.model_name,
+                system_instruction=self.instructions,
+                generation_config={
+                    'response_mime_type': 'application/json',
+                    'response_schema': QuizResponse
+                }
+            )
         elif model_type == 'openai':
-            self.client = OpenAI(api_key=config.OPENAI_API_KEY)
+            self.client = get_openai_client()
+    
+    @staticmethod
+    def build_prompt(summary, content):
+        """The per-call part of the prompt: just the document"""
+        return f"SUMMARY:\n{summary}\n\nSOURCE CONTENT:\n{content}"
+    
+    @llm_retry
+    async def _call_google(self, prompt, **kwargs):
+        return await self.model.generate_content_async(prompt, **kwargs)
     
-    def generate_with_google(self, summary, content):
-        """Generate quiz using Google Gemini 2.5 Flash with RAG"""
+    @llm_retry
+    async def _call_openai(self, prompt, response_format, max_tokens):
+        return await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {
+                    "role": "system",
+                    "content": self.instructions
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            response_format=response_format,
+            temperature=0.7,
+            max_tokens=max_tokens
+        )
+    
+    async def generate_with_google(self, summary, content):
+        """Generate quiz using Google Gemini with RAG"""
         try:
-            prompt = f"""
-            Based on the following summary and source content, generate {self.num_questions} educational quiz questions.
-            
-            Return ONLY valid JSON (no markdown code blocks) with this exact structure:
-            {{
-                "questions": [
-                    {{
-                        "id": 1,
-                        "question": "Question text here?",
-                        "type": "multiple_choice",
-                        "options": ["Option A", "Option B", "Option C", "Option D"],
-                        "correct_answer": "Option A",
-                        "explanation": "Why this answer is correct based on the content"
-                    }},
-                    {{
-                        "id": 2,
-                        "question": "True or False statement",
-                        "type": "true_false",
-                        "correct_answer": true,
-                        "explanation": "Explanation"
-                    }},
-                    {{
-                        "id": 3,
-                        "question": "Fill in the blank: The capital of France is _____",
-                        "type": "fill_blank",
-                        "correct_answer": "Paris",
-                        "explanation": "From the content"
-                    }}
-                ]
-            }}
-            
-            SUMMARY (use this for context):
-            {summary[:1000]}
-            
-            SOURCE CONTENT (ground questions here):
-            {content[:2000]}
-            
-            Generate now:
-            """
-            
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
+            prompt = self.build_prompt(summary, content)
             
-            # Clean markdown if present
-            if response_text.startswith('```'):
-                response_text = response_text.split('```')[1]
-                if response_text.startswith('json'):
-                    response_text = response_text[4:]
-                response_text = response_text.strip()
+            response = await self._call_google(prompt)
+            quiz_data = orjson.loads(response.text)
             
-            quiz_data = json.loads(response_text)
-            
-            logger.info("Quiz generated successfully with Gemini 2.5 Flash")
+            logger.info(f"Quiz generated successfully with {self.model_name}")
             return {
                 'status': 'success',
                 'quiz': quiz_data.get('questions', []),
-                'model': 'google-gemini-2.5-flash'
+                'model': f'google-{self.model_name}'
             }
         
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"JSON parse error in quiz generation: {str(e)}")
             return {
                 'status': 'error',
@@ -95,51 +152,25 @@ class QuizGenerator:
                 'message': f"Quiz generation failed: {str(e)}"
             }
     
-    def generate_with_openai(self, summary, content):
+    async def generate_with_openai(self, summary, content):
         """Generate quiz using OpenAI"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert quiz generator for educational content. Return ONLY valid JSON."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"""Generate {self.num_questions} quiz questions from this content as JSON:
-                        
-                        SUMMARY: {summary[:1000]}
-                        
-                        CONTENT: {content[:2000]}
-                        
-                        Return valid JSON with structure:
-                        {{"questions": [{{"id": 1, "question": "...", "type": "multiple_choice", "options": [...], "correct_answer": "...", "explanation": "..."}}]}}"""
-                    }
-                ],
-                temperature=0.7,
+            response = await self._call_openai(
+                self.build_prompt(summary, content),
+                openai_response_format('quiz', QuizResponse),
                 max_tokens=1000
             )
             
-            response_text = response.choices[0].message.content.strip()
-            
-            # Clean markdown
-            if response_text.startswith('```'):
-                response_text = response_text.split('```')[1]
-                if response_text.startswith('json'):
-                    response_text = response_text[4:]
-                response_text = response_text.strip()
+            quiz_data = orjson.loads(response.choices[0].message.content)
             
-            quiz_data = json.loads(response_text)
-            
-            logger.info("Quiz generated successfully with OpenAI")
+            logger.info(f"Quiz generated successfully with {self.model_name}")
             return {
                 'status': 'success',
                 'quiz': quiz_data.get('questions', []),
-                'model': 'openai-gpt3.5'
+                'model': f'openai-{self.model_name}'
             }
         
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             logger.error("JSON parse error in OpenAI quiz generation")
             return {
                 'status': 'error',
@@ -152,14 +183,112 @@ class QuizGenerator:
                 'message': f"Quiz generation failed: {str(e)}"
             }
     
-    def generate(self, summary, content):
+    @CachedLLM('quiz')
+    async def generate(self, summary, content):
         """Main quiz generation method"""
+        return await self._generate(summary, content)
+    
+    async def _generate(self, summary, content):
+        """Dispatch a single quiz request to the configured provider"""
         if self.model_type == 'google':
-            return self.generate_with_google(summary, content)
+            return await self.generate_with_google(summary, content)
         elif self.model_type == 'openai':
-            return self.generate_with_openai(summary, content)
+            return await self.generate_with_openai(summary, content)
         else:
             return {
                 'status': 'error',
                 'message': 'Unknown model type'
             }
+
+
+class BatchingQuizGenerator(QuizGenerator):
+    """
+    Collects concurrent quiz requests for a short window and sends them
+    to the LLM as one prompt, splitting the indexed answers back to callers
+    """
+    
+    def __init__(self, model_type='google', model_name=None, window_ms=50, max_batch_size=8):
+        super().__init__(model_type, model_name)
+        self._batcher = MicroBatcher(self._run_batch, window_ms=window_ms, max_batch_size=max_batch_size)
+    
+    async def _generate(self, summary, content):
+        """Queue the request and wait for its slot of the batched response"""
+        return await self._batcher.submit((summary, content))
+    
+    async def _run_batch(self, documents):
+        """One result per (summary, content) document"""
+        try:
+            if len(documents) == 1:
+                return [await super()._generate(*documents[0])]
+            return await self._generate_batch(documents)
+        except Exception as e:
+            logger.error(f"Error in batched quiz generation: {str(e)}")
+            return [{
+                'status': 'error',
+                'message': f"Quiz generation failed: {str(e)}"
+            }] * len(documents)
+    
+    async def _generate_batch(self, documents):
+        """Generate quizzes for several documents with a single LLM call"""
+        sections = [
+            f"DOCUMENT {i}\n{self.build_prompt(summary, content)}"
+            for i, (summary, content) in enumerate(documents)
+        ]
+        
+        # Question format comes from the system instructions; only the batch envelope is described here
+        prompt = (
+            f"There are {len(documents)} documents. Return JSON with one entry per document in "
+            f'"quizzes", indexed 0..{len(documents) - 1}: '
+            '{"quizzes": [{"index": 0, "questions": [...]}]}\n\n'
+            + '\n\n'.join(sections)
+        )
+        
+        try:
+            if self.model_type == 'google':
+                response = await self._call_google(
+                    prompt,
+                    generation_config={
+                        'response_mime_type': 'application/json',
+                        'response_schema': BatchedQuizResponse
+                    }
+                )
+                response_text = response.text
+                model_label = f'google-{self.model_name}'
+            elif self.model_type == 'openai':
+                response = await self._call_openai(
+                    prompt,
+                    openai_response_format('batched_quiz', BatchedQuizResponse),
+                    max_tokens=1000 * len(documents)
+                )
+                response_text = response.choices[0].message.content
+                model_label = f'openai-{self.model_name}'
+            else:
+                return [{
+                    'status': 'error',
+                    'message': 'Unknown model type'
+                }] * len(documents)
+            
+            quizzes = {
+                int(item['index']): item.get('questions', [])
+                for item in orjson.loads(response_text)['quizzes']
+            }
+        
+        except (orjson.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Could not parse batched quiz response, falling back to single calls: {str(e)}")
+            quizzes = {}
+        
+        logger.info(f"Batched quiz generation for {len(documents)} documents, {len(quizzes)} parsed")
+        
+        results = [
+            {'status': 'success', 'quiz': quizzes[i], 'model': model_label} if i in quizzes else None
+            for i in range(len(documents))
+        ]
+        
+        # Anything the batch did not answer is generated on its own
+        missing = [i for i, result in enumerate(results) if result is None]
+        single = super()._generate
+        fallback = await asyncio.gather(*[single(*documents[i]) for i in missing])
+        for i, result in zip(missing, fallback):
+            results[i] = result
+        
+        return results
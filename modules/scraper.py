@@ -1,13 +1,28 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import json
+from functools import lru_cache
+import httpx
+from selectolax.parser import HTMLParser
 from youtube_transcript_api import YouTubeTranscriptApi
 import re
 import logging
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from config import config
+from modules.batching import MicroBatcher
+from modules.cache import article_cache
 
 logger = logging.getLogger(__name__)
 
+# Compiled once: URL classification and video ID extraction run on every request
+YOUTUBE_URL_RE = re.compile(r'(?:https?://)?(?:www\.)?(?:youtube|youtu|youtube-nocookie)\.(?:com|be)/')
+YOUTUBE_ID_RE = re.compile(r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|embed/)|youtu\.be/)([^&\n?#]+)')
+
+# Collapses whitespace runs in scraped text in a single pass
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Shared clients so connection pools and TLS sessions stay warm across requests
+_CLIENT = None
+_API_CLIENT = None  # youtube-transcript.io, without the browser headers/cookies
+
 class WebScraper:
     """Extracts text content from articles and videos with robust error handling"""
     
@@ -16,64 +31,99 @@ class WebScraper:
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
         'Accept-Language': 'en-US,en;q=0.9',
-        'Accept-Encoding': 'gzip, deflate',
+        'Accept-Encoding': 'br, gzip, deflate',
         'DNT': '1',
         'Connection': 'keep-alive',
         'Upgrade-Insecure-Requests': '1',
     }
     
+    # Elements that never hold article text
+    STRIP_TAGS = ['script', 'style', 'noscript', 'svg', 'iframe', 'nav', 'footer']
+    
+    # Retry strategy for article fetches
+    MAX_RETRIES = 3
+    BACKOFF_FACTOR = 1
+    RETRY_STATUSES = [429, 500, 502, 503, 504]
+    
     @staticmethod
-    def create_session_with_retries():
-        """Create a requests session with retry logic and proper headers"""
-        session = requests.Session()
-        
-        # Add retry strategy
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["GET", "POST"]
+    def create_client():
+        """Create an async HTTP client with connection pooling and proper headers"""
+        transport = httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            retries=WebScraper.MAX_RETRIES
         )
         
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        
-        # Set headers
-        session.headers.update(WebScraper.HEADERS)
-        
-        # Add cookies consent
-        session.cookies.update({
-            'CONSENT': 'PENDING+999',
-        })
-        
-        return session
+        return httpx.AsyncClient(
+            transport=transport,
+            headers=WebScraper.HEADERS,
+            # Add cookies consent
+            cookies={'CONSENT': 'PENDING+999'},
+            timeout=config.REQUEST_TIMEOUT,
+            follow_redirects=True
+        )
+    
+    @staticmethod
+    def get_client():
+        """Return the process-wide HTTP client, creating it on first use"""
+        global _CLIENT
+        if _CLIENT is None or _CLIENT.is_closed:
+            _CLIENT = WebScraper.create_client()
+        return _CLIENT
+    
+    @staticmethod
+    def get_api_client():
+        """Return the process-wide HTTP/2 client for the transcript API, creating it on first use"""
+        global _API_CLIENT
+        if _API_CLIENT is None or _API_CLIENT.is_closed:
+            _API_CLIENT = httpx.AsyncClient(
+                http2=True,
+                timeout=config.TRANSCRIPT_API_TIMEOUT,
+                headers={'Content-Type': 'application/json'}
+            )
+        return _API_CLIENT
     
     @staticmethod
+    async def close_client():
+        """Close the process-wide HTTP clients"""
+        global _CLIENT, _API_CLIENT
+        if _CLIENT is not None:
+            await _CLIENT.aclose()
+            _CLIENT = None
+        if _API_CLIENT is not None:
+            await _API_CLIENT.aclose()
+            _API_CLIENT = None
+    
+    @staticmethod
+    async def get_with_retries(client, url, timeout=10):
+        """GET a URL, backing off on rate-limit and server error responses"""
+        for attempt in range(WebScraper.MAX_RETRIES + 1):
+            response = await client.get(url, timeout=timeout)
+            if response.status_code not in WebScraper.RETRY_STATUSES or attempt == WebScraper.MAX_RETRIES:
+                return response
+            
+            delay = WebScraper.BACKOFF_FACTOR * (2 ** attempt)
+            logger.warning(f"Got {response.status_code} from {url}, retrying in {delay}s")
+            await asyncio.sleep(delay)
+    
+    @staticmethod
+    @lru_cache(maxsize=1024)
     def is_youtube_url(url):
         """Check if URL is YouTube"""
-        youtube_regex = (
-            r'(https?://)?(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/'
-        )
-        return re.match(youtube_regex, url) is not None
+        return YOUTUBE_URL_RE.match(url) is not None
     
     @staticmethod
+    @lru_cache(maxsize=1024)
     def extract_youtube_id(url):
         """Extract YouTube video ID from URL"""
-        patterns = [
-            r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/)([^&\n?#]+)',
-            r'(?:youtube\.com\/watch\?.*v=)([^&\n?#]+)',
-            r'youtu\.be\/([^?&]+)',
-            r'youtube\.com\/embed\/([^?&]+)',
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, url)
-            if match:
-                return match.group(1)
-        return None
+        match = YOUTUBE_ID_RE.search(url)
+        return match.group(1) if match else None
     
     @staticmethod
-    def get_youtube_transcript(url):
+    async def get_youtube_transcript(url):
         """
         Extract transcript from YouTube video using youtube-transcript.io API
         Handles the complex nested response format correctly
@@ -92,7 +142,6 @@ class WebScraper:
             
             try:
                 # Get API key from config
-                from config import config
                 api_key = config.YOUTUBE_TRANSCRIPT_IO_API_KEY
                 
                 if not api_key:
@@ -105,39 +154,24 @@ class WebScraper:
                 
                 logger.info("Calling youtube-transcript.io API...")
                 
-                # Call the API
-                response = requests.post(
-                    "https://www.youtube-transcript.io/api/transcripts",
-                    headers={
-                        "Authorization": f"Basic {api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={"ids": [video_id]}
-                )
-                
-                logger.info(f"API Response Status: {response.status_code}")
+                # Call the API (batched with other concurrent lookups)
+                status_code, transcript_item = await _transcript_batcher.fetch(video_id)
                 
-                if response.status_code != 200:
-                    logger.error(f"API Error {response.status_code}: {response.text}")
+                if status_code != 200:
                     return {
                         'status': 'error',
-                        'message': f"API Error: {response.status_code}. Video may not have captions.",
+                        'message': f"API Error: {status_code}. Video may not have captions.",
                         'url': url
                     }
                 
-                data = response.json()
-                logger.info(f"API Response keys: {data.keys() if isinstance(data, dict) else type(data)}")
-                
-                # Check if we got transcripts
-                if not data or not isinstance(data, list) or len(data) == 0:
+                # Check if we got a transcript
+                if not transcript_item:
                     return {
                         'status': 'error',
                         'message': '⚠️ No transcript found for this video.',
                         'url': url
                     }
                 
-                # The API returns a list with one item containing all the data
-                transcript_item = data[0]
                 logger.info(f"Transcript item keys: {transcript_item.keys()}")
                 
                 # Extract the text from the correct location
@@ -197,7 +231,7 @@ class WebScraper:
                     'type': 'video'
                 }
             
-            except requests.exceptions.Timeout:
+            except httpx.TimeoutException:
                 logger.error("API request timeout")
                 return {
                     'status': 'error',
@@ -205,7 +239,7 @@ class WebScraper:
                     'url': url
                 }
             
-            except requests.exceptions.JSONDecodeError as e:
+            except json.JSONDecodeError as e:
                 logger.error(f"Failed to parse API response: {str(e)}")
                 return {
                     'status': 'error',
@@ -247,25 +281,26 @@ class WebScraper:
 
     
     @staticmethod
-    def scrape_article(url, timeout=10):
+    async def scrape_article(url, client=None, timeout=10):
         """Scrape text from article URL"""
         try:
-            session = WebScraper.create_session_with_retries()
-            response = session.get(url, timeout=timeout)
+            client = client or WebScraper.get_client()
+            response = await WebScraper.get_with_retries(client, url, timeout=timeout)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            tree = HTMLParser(response.content)
             
-            # Remove script and style elements
-            for script in soup(['script', 'style']):
-                script.decompose()
+            # Extract title
+            title_node = tree.css_first('title')
+            title = title_node.text(strip=True) if title_node else "No title"
             
-            # Extract main text
-            text = soup.get_text(separator=' ', strip=True)
-            text = ' '.join(text.split())
+            # Remove non-content elements in a single tree walk
+            tree.strip_tags(WebScraper.STRIP_TAGS)
             
-            # Extract title
-            title = soup.title.string if soup.title else "No title"
+            # Extract main text
+            root = tree.body or tree.root
+            text = root.text(separator=' ', strip=True) if root else ''
+            text = WHITESPACE_RE.sub(' ', text).strip()
             
             if len(text) < 100:
                 return {
@@ -283,14 +318,14 @@ class WebScraper:
                 'type': 'article'
             }
         
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             logger.error(f"Timeout while scraping {url}")
             return {
                 'status': 'error',
                 'message': 'Request timed out. Website took too long to respond.',
                 'url': url
             }
-        except requests.exceptions.ConnectionError:
+        except httpx.TransportError:
             logger.error(f"Connection error while scraping {url}")
             return {
                 'status': 'error',
@@ -306,7 +341,7 @@ class WebScraper:
             }
     
     @staticmethod
-    def extract_content(url):
+    async def extract_content(url, client=None):
         """Main method: extract content from URL (article or video)"""
         if not url or not isinstance(url, str):
             return {
@@ -315,8 +350,103 @@ class WebScraper:
             }
         
         url = url.strip()
+        is_youtube = WebScraper.is_youtube_url(url)
+        
+        # Key videos on their ID so youtu.be and watch?v= variants share an entry
+        video_id = WebScraper.extract_youtube_id(url) if is_youtube else None
+        cache_key = f"youtube:{video_id}" if video_id else url
         
-        if WebScraper.is_youtube_url(url):
-            return WebScraper.get_youtube_transcript(url)
+        cached = await article_cache.get(cache_key)
+        if cached:
+            logger.info(f"Article cache hit for {url}")
+            return {
+                'status': 'success',
+                'title': cached['title'],
+                'content': cached['content'],
+                'url': url,
+                'type': cached['type']
+            }
+        
+        if is_youtube:
+            result = await WebScraper.get_youtube_transcript(url)
         else:
-            return WebScraper.scrape_article(url)
+            result = await WebScraper.scrape_article(url, client)
+        
+        if result['status'] == 'success':
+            await article_cache.set(cache_key, result['title'], result['content'], result['type'])
+        
+        return result
+
+
+class YoutubeTranscriptBatcher:
+    """
+    Collects transcript lookups arriving within a short window and fetches
+    them with one youtube-transcript.io request, matching results by video ID
+    """
+    
+    API_URL = "https://www.youtube-transcript.io/api/transcripts"
+    
+    # Failures that apply to the whole request, not to one bad ID
+    REQUEST_WIDE_STATUSES = {401, 403, 429}
+    
+    def __init__(self, window_ms=30, max_batch_size=10):
+        self._batcher = MicroBatcher(self._fetch_many, window_ms=window_ms, max_batch_size=max_batch_size)
+    
+    async def fetch(self, video_id):
+        """Return (status_code, transcript item or None) for one video"""
+        return await self._batcher.submit(video_id)
+    
+    async def _post(self, video_ids):
+        """One API request; returns (status_code, {video_id: item})"""
+        response = await WebScraper.get_api_client().post(
+            self.API_URL,
+            headers={
+                "Authorization": f"Basic {config.YOUTUBE_TRANSCRIPT_IO_API_KEY}"
+            },
+            json={"ids": video_ids}
+        )
+        
+        logger.info(f"API Response Status: {response.status_code} ({len(video_ids)} videos)")
+        
+        if response.status_code != 200:
+            logger.error(f"API Error {response.status_code}: {response.text}")
+            return response.status_code, {}
+        return response.status_code, self._match_items(video_ids, response.json())
+    
+    async def _fetch_many(self, requested):
+        """POST all IDs in the batch; one (status_code, item) per requested ID"""
+        video_ids = list(dict.fromkeys(requested))
+        status_code, items = await self._post(video_ids)
+        answers = {video_id: (status_code, items.get(video_id)) for video_id in video_ids}
+        
+        # One bad ID can fail a multi-ID request: retry each on its own so it only fails its own caller
+        if status_code != 200 and len(video_ids) > 1 and status_code not in self.REQUEST_WIDE_STATUSES:
+            singles = await asyncio.gather(*[self._post([video_id]) for video_id in video_ids], return_exceptions=True)
+            for video_id, single in zip(video_ids, singles):
+                if isinstance(single, Exception):
+                    answers[video_id] = single
+                else:
+                    answers[video_id] = (single[0], single[1].get(video_id))
+        
+        return [answers[video_id] for video_id in requested]
+    
+    @staticmethod
+    def _match_items(video_ids, data):
+        """Map each returned transcript item to its video ID"""
+        if not data or not isinstance(data, list):
+            return {}
+        
+        items = {}
+        for position, item in enumerate(data):
+            if isinstance(item, dict) and 'id' in item:
+                items[item['id']] = item
+            elif position < len(video_ids):
+                # No ID on the item: the API keeps request order
+                items[video_ids[position]] = item
+        return items
+
+
+_transcript_batcher = YoutubeTranscriptBatcher(
+    window_ms=config.TRANSCRIPT_BATCH_WINDOW_MS,
+    max_batch_size=config.TRANSCRIPT_BATCH_MAX_SIZE
+)
@@ -1,45 +1,303 @@
-import google.generativeai as genai
-from openai import OpenAI
+import asyncio
+import hashlib
 import logging
+import orjson
+import re
+import sys
+import threading
+import time
+from functools import lru_cache
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential, before_sleep_log
 from config import config
+from modules.cache import CachedLLM, llm_cache, llm_cache_key
+from modules.clients import get_openai_client
 
 logger = logging.getLogger(__name__)
 
+# Byte-identical on every call so providers can cache the prefix;
+# the content is always sent last, on its own
+SUMMARY_INSTRUCTIONS = """You are an expert summarizer.
+Provide a concise summary of the content you are given in 150-200 words only.
+Focus on the 3-5 most important key points.
+Make it suitable for educational purposes.
+Keep it brief and impactful."""
+
+WORD_RE = re.compile(r"\w+")
+
+# Gemini finish reasons that mean the summary was cut off by a filter, not completed
+BLOCKED_FINISH_REASONS = {'SAFETY', 'RECITATION', 'BLOCKLIST', 'PROHIBITED_CONTENT', 'SPII'}
+
+async def _log_ttft(chunks, label):
+    """Pass chunks through, logging time to the first one"""
+    started = time.perf_counter()
+    first = True
+    async for text in chunks:
+        if first:
+            logger.info(f"{label} TTFT: {(time.perf_counter() - started) * 1000:.0f} ms")
+            first = False
+        yield text
+
+def _is_transient(exc):
+    """Rate limits, timeouts and server errors are worth retrying; auth errors and bad requests are not"""
+    # Only the provider SDK in use is imported, so only look at modules already loaded
+    openai = sys.modules.get('openai')
+    if openai and isinstance(exc, (openai.RateLimitError, openai.APITimeoutError,
+                                   openai.APIConnectionError, openai.InternalServerError)):
+        return True
+    
+    google_exceptions = sys.modules.get('google.api_core.exceptions')
+    if google_exceptions and isinstance(exc, (google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable,
+                                              google_exceptions.DeadlineExceeded, google_exceptions.InternalServerError)):
+        return True
+    
+    return False
+
+llm_retry = retry(
+    stop=stop_after_attempt(4),
+    wait=wait_random_exponential(min=1, max=30),
+    retry=retry_if_exception(_is_transient),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True
+)
+
+async def fit_google_input(model, content, budget):
+    """Trim content to a Gemini input token budget"""
+    # A Gemini token covers at least one character, so short content cannot be over budget
+    for _ in range(3):
+        if len(content) <= budget:
+            return content
+        tokens = (await model.count_tokens_async(content)).total_tokens
+        if tokens <= budget:
+            return content
+        # Scale by the measured chars-per-token ratio, with a little headroom
+        content = content[:int(len(content) * budget / tokens * 0.95)]
+    return content
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name):
+    """tiktoken encoding for an OpenAI model; newer models fall back to o200k_base"""
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding('o200k_base')
+
+def fit_openai_input(model_name, content, budget):
+    """Trim content to an OpenAI input token budget on a token boundary"""
+    # Byte-level BPE: a token is at least one UTF-8 byte, and a character at most four,
+    # so only content this short is known to fit without encoding it
+    if len(content) * 4 <= budget:
+        return content
+    encoding = get_encoding(model_name)
+    tokens = encoding.encode(content)
+    return content if len(tokens) <= budget else encoding.decode(tokens[:budget])
+
 class LLMSummarizer:
     """Generates summaries using LLM APIs"""
     
-    def __init__(self, model_type='google'):
+    def __init__(self, model_type='google', model_name=None):
         self.model_type = model_type
+        self.model_name = model_name or {
+            'google': config.GEMINI_MODEL,
+            'local': config.LOCAL_SUMMARY_MODEL
+        }.get(model_type, config.OPENAI_MODEL)
+        self._inflight = {}  # content hash -> task, shared by identical concurrent requests
         
+        # Provider SDKs are heavy; import only the one in use
         if model_type == 'google':
+            import google.generativeai as genai
             genai.configure(api_key=config.GOOGLE_API_KEY)
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
+            self.model = genai.GenerativeModel(self.model_name, system_instruction=SUMMARY_INSTRUCTIONS)
         elif model_type == 'openai':
-            self.client = OpenAI(api_key=config.OPENAI_API_KEY)
+            self.client = get_openai_client()
+        elif model_type == 'local':
+            # Loaded on first use; the remote summarizer is only built if it is needed
+            self._pipeline = None
+            self._pipeline_lock = threading.Lock()
+            self._fallback = None
     
-    def summarize_with_google(self, content):
-        """Summarize using Google Gemini 2.5 Flash"""
-        try:
-            prompt = f"""
-            Provide a concise summary of the following content in 150-200 words only.
-            Focus on the 3-5 most important key points.
-            Make it suitable for educational purposes.
-            Keep it brief and impactful.
-            
-            Content:
-            {content[:300000]}
-            
-            Summary:
-            """
+    async def _fit_google(self, content):
+        """Trim content to the Gemini input token budget"""
+        return await fit_google_input(self.model, content, config.SUMMARY_MAX_INPUT_TOKENS)
+    
+    def _fit_openai(self, content):
+        """Trim content to the OpenAI input token budget on a token boundary"""
+        return fit_openai_input(self.model_name, content, config.OPENAI_SUMMARY_MAX_INPUT_TOKENS)
+    
+    async def _fit_openai_async(self, content):
+        return await asyncio.to_thread(self._fit_openai, content)
+    
+    def _get_encoding(self):
+        return get_encoding(self.model_name)
+    
+    @llm_retry
+    async def _call_google(self, content):
+        return await self.model.generate_content_async(content, stream=True)
+    
+    @llm_retry
+    async def _call_openai(self, content):
+        return await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {
+                    "role": "system",
+                    "content": SUMMARY_INSTRUCTIONS
+                },
+                {
+                    "role": "user",
+                    "content": content
+                }
+            ],
+            temperature=0.7,
+            max_tokens=300,
+            stream=True
+        )
+    
+    @llm_retry
+    async def _call_openai_batch(self, prompt, num_documents):
+        return await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {
+                    "role": "system",
+                    "content": SUMMARY_INSTRUCTIONS
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.7,
+            max_tokens=300 * num_documents
+        )
+    
+    async def _stream_google(self, content):
+        response = await self._call_google(content)
+        async for chunk in response:
+            candidate = chunk.candidates[0] if chunk.candidates else None
+            if candidate is None:
+                # No candidate at all: the prompt itself was blocked
+                if chunk.prompt_feedback.block_reason:
+                    raise ValueError(f"Gemini blocked the content: {chunk.prompt_feedback.block_reason.name}")
+                continue
             
-            response = self.model.generate_content(prompt)
-            summary = response.text
+            # The closing chunk may carry only a finish reason; .text raises on a chunk with no parts
+            if candidate.content.parts:
+                yield chunk.text
+            if candidate.finish_reason.name in BLOCKED_FINISH_REASONS:
+                raise ValueError(f"Gemini stopped the summary: {candidate.finish_reason.name}")
+    
+    async def _stream_openai(self, content):
+        stream = await self._call_openai(content)
+        async for chunk in stream:
+            if chunk.choices:
+                yield chunk.choices[0].delta.content or ""
+    
+    async def _map_summarize(self, chunk, stream):
+        return ''.join([text async for text in stream(chunk)])
+    
+    async def _condense(self, content, stream):
+        """
+        Map step: summarize fixed-size chunks of long content in parallel
+        and return the partial summaries, ready for one reduce call.
+        Content shorter than a chunk is returned as is.
+        """
+        size = config.SUMMARY_CHUNK_CHARS
+        if not size or len(content) < size:
+            return content
+        
+        chunks = [content[i:i + size] for i in range(0, len(content), size)]
+        semaphore = asyncio.Semaphore(config.SUMMARY_MAX_CONCURRENCY)
+        
+        async def map_one(chunk):
+            async with semaphore:
+                return await self._map_summarize(chunk, stream)
+        
+        started = time.perf_counter()
+        partials = await asyncio.gather(*[map_one(c) for c in chunks])
+        logger.info(f"Summarized {len(chunks)} chunks in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return "\n\n".join(partials)
+    
+    async def _map_reduce(self, content, stream, fit):
+        # The token budget caps the whole input, so chunking never sends more than one call would;
+        # each chunk is part of the trimmed text and therefore within budget on its own.
+        # (OpenAI's 2000-token budget is below one chunk, so it stays a single call.)
+        content = await fit(content)
+        # The reduce call streams; only the map step is awaited in full
+        async for text in stream(await self._condense(content, stream)):
+            yield text
+    
+    def stream_with_google(self, content):
+        """Stream summary text from Google Gemini as it is generated"""
+        return _log_ttft(self._map_reduce(content, self._stream_google, self._fit_google), "Gemini summary")
+    
+    def stream_with_openai(self, content):
+        """Stream summary text from OpenAI GPT as it is generated"""
+        return _log_ttft(self._map_reduce(content, self._stream_openai, self._fit_openai_async), "OpenAI summary")
+    
+    def _load_local(self):
+        with self._pipeline_lock:
+            if self._pipeline is None:
+                import torch
+                from transformers import pipeline
+                torch.set_num_threads(config.LOCAL_SUMMARY_THREADS)
+                self._pipeline = pipeline('summarization', model=self.model_name, device=-1)
+                logger.info(f"Loaded local summarization model {self.model_name}")
+        return self._pipeline
+    
+    def _run_local(self, content):
+        output = self._load_local()(content, max_length=200, min_length=60, truncation=True, do_sample=False)
+        return output[0]['summary_text'].strip()
+    
+    @staticmethod
+    def _passes_quality_check(summary, content):
+        """Cheap faithfulness check: long enough, and almost every word taken from the source"""
+        words = WORD_RE.findall(summary.lower())
+        if len(words) < config.LOCAL_SUMMARY_MIN_WORDS:
+            return False
+        source = set(WORD_RE.findall(content.lower()))
+        return sum(word in source for word in words) / len(words) >= config.LOCAL_SUMMARY_MIN_COVERAGE
+    
+    def _get_fallback(self):
+        if self._fallback is None:
+            self._fallback = LLMSummarizer(config.LOCAL_SUMMARY_FALLBACK)
+        return self._fallback
+    
+    async def summarize_with_local(self, content):
+        """Summarize short content on CPU, deferring to the remote model when the result is not good enough"""
+        if len(content) < config.LOCAL_SUMMARY_MAX_CHARS:
+            try:
+                summary = await asyncio.to_thread(self._run_local, content)
+                if self._passes_quality_check(summary, content):
+                    logger.info(f"Summary generated successfully with {self.model_name}")
+                    return {
+                        'status': 'success',
+                        'summary': summary,
+                        'model': f'local-{self.model_name}'
+                    }
+                logger.info("Local summary failed the quality check, using the remote model")
+            except Exception as e:
+                logger.warning(f"Local summarization failed, using the remote model: {str(e)}")
+        
+        return await self._get_fallback()._summarize(content)
+    
+    async def _stream_local(self, content):
+        result = await self.summarize_with_local(content)
+        if result['status'] != 'success':
+            raise RuntimeError(result['message'])
+        yield result['summary']
+    
+    async def summarize_with_google(self, content):
+        """Summarize using Google Gemini"""
+        try:
+            summary = ''.join([text async for text in self.stream_with_google(content)])
             
-            logger.info("Summary generated successfully with Gemini 2.5 Flash")
+            logger.info(f"Summary generated successfully with {self.model_name}")
             return {
                 'status': 'success',
                 'summary': summary,
-                'model': 'google-gemini-2.5-flash'
+                'model': f'google-{self.model_name}'
             }
         
         except Exception as e:
@@ -49,31 +307,16 @@ class LLMSummarizer:
                 'message': f"Summarization failed: {str(e)}"
             }
     
-    def summarize_with_openai(self, content):
+    async def summarize_with_openai(self, content):
         """Summarize using OpenAI GPT"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert summarizer. Provide clear, educational summaries."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Summarize this in 200-300 words:\n\n{content[:2000]}"
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=300
-            )
+            summary = ''.join([text async for text in self.stream_with_openai(content)])
             
-            summary = response.choices[0].message.content
-            logger.info("Summary generated successfully with OpenAI")
+            logger.info(f"Summary generated successfully with {self.model_name}")
             return {
                 'status': 'success',
                 'summary': summary,
-                'model': 'openai-gpt3.5'
+                'model': f'openai-{self.model_name}'
             }
         
         except Exception as e:
@@ -83,7 +326,28 @@ class LLMSummarizer:
                 'message': f"Summarization failed: {str(e)}"
             }
     
-    def summarize(self, content):
+    def summarize_stream(self, content):
+        """
+        Streaming summarization: returns an async iterator of text chunks.
+        Raises ValueError for input summarize() would reject.
+        """
+        if not content or len(content) < 100:
+            raise ValueError('Content too short for summarization')
+        
+        if self.model_type == 'google':
+            return self.stream_with_google(content)
+        elif self.model_type == 'openai':
+            return self.stream_with_openai(content)
+        elif self.model_type == 'local':
+            # Local output arrives in one piece; long content streams from the remote model
+            if len(content) >= config.LOCAL_SUMMARY_MAX_CHARS:
+                return self._get_fallback().summarize_stream(content)
+            return self._stream_local(content)
+        else:
+            raise ValueError('Unknown model type')
+    
+    @CachedLLM('summary')
+    async def summarize(self, content):
         """Main summarization method"""
         if not content or len(content) < 100:
             return {
@@ -91,12 +355,138 @@ class LLMSummarizer:
                 'message': 'Content too short for summarization'
             }
         
+        # Single-flight: identical content already being summarized shares that call
+        key = hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._summarize(content))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            logger.info("Joining in-flight summarization for identical content")
+        
+        # Shielded so one caller going away does not cancel the others
+        return await asyncio.shield(task)
+    
+    async def _summarize(self, content):
+        """Dispatch to the configured provider"""
         if self.model_type == 'google':
-            return self.summarize_with_google(content)
+            return await self.summarize_with_google(content)
         elif self.model_type == 'openai':
-            return self.summarize_with_openai(content)
+            return await self.summarize_with_openai(content)
+        elif self.model_type == 'local':
+            return await self.summarize_with_local(content)
         else:
             return {
                 'status': 'error',
                 'message': 'Unknown model type'
             }
+    
+    async def summarize_many(self, contents, max_concurrency=None):
+        """Summarize several documents concurrently; results keep the input order"""
+        semaphore = asyncio.Semaphore(max_concurrency or config.SUMMARY_MAX_CONCURRENCY)
+        
+        async def summarize_one(content):
+            async with semaphore:
+                return await self.summarize(content)
+        
+        results = await asyncio.gather(*[summarize_one(c) for c in contents], return_exceptions=True)
+        
+        return [
+            {'status': 'error', 'message': f"Summarization failed: {str(r)}"} if isinstance(r, Exception) else r
+            for r in results
+        ]
+    
+    def _pack_batches(self, contents):
+        """Trim each document to its budget and group them under the per-call token and document caps"""
+        encoding = self._get_encoding()
+        budget = config.SUMMARY_BATCH_MAX_TOKENS
+        batches, current, used = [], [], 0
+        for i, content in contents:
+            content = self._fit_openai(content)
+            tokens = len(encoding.encode(content))
+            if current and (used + tokens > budget or len(current) >= config.SUMMARY_BATCH_MAX_SIZE):
+                batches.append(current)
+                current, used = [], 0
+            current.append((i, content))
+            used += tokens
+        if current:
+            batches.append(current)
+        return batches
+    
+    async def _summarize_openai_batch(self, documents):
+        """Summarize several (index, content) documents with a single chat call"""
+        sections = [f"DOCUMENT {n}\n{content}" for n, (_, content) in enumerate(documents)]
+        prompt = (
+            f"Summarize each of the {len(documents)} documents below separately. Return JSON with one entry "
+            f'per document in "summaries", indexed 0..{len(documents) - 1}: '
+            '{"summaries": [{"index": 0, "summary": "..."}]}\n\n'
+            + '\n\n'.join(sections)
+        )
+        
+        response = await self._call_openai_batch(prompt, len(documents))
+        try:
+            summaries = {
+                int(item['index']): item['summary']
+                for item in orjson.loads(response.choices[0].message.content)['summaries']
+                if item.get('summary')
+            }
+        except (orjson.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Could not parse batched summary response, falling back to single calls: {str(e)}")
+            summaries = {}
+        
+        logger.info(f"Batched summarization for {len(documents)} documents, {len(summaries)} parsed")
+        
+        results = {}
+        for n, (i, _) in enumerate(documents):
+            if n in summaries:
+                results[i] = {
+                    'status': 'success',
+                    'summary': summaries[n],
+                    'model': f'openai-{self.model_name}'
+                }
+        return results
+    
+    async def summarize_batch(self, contents):
+        """
+        Summarize several documents in as few LLM calls as possible; results keep the input order.
+        OpenAI packs documents into one chat call per token budget, other providers use summarize_many.
+        """
+        if self.model_type != 'openai':
+            return await self.summarize_many(contents)
+        
+        results = [None] * len(contents)
+        pending = []
+        for i, content in enumerate(contents):
+            if not content or len(content) < 100:
+                results[i] = {
+                    'status': 'error',
+                    'message': 'Content too short for summarization'
+                }
+                continue
+            
+            # Same cache entries summarize() reads and writes
+            cached = await llm_cache.get(llm_cache_key('summary', self, content))
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append((i, content))
+        
+        batches = await asyncio.to_thread(self._pack_batches, pending) if pending else []
+        answered = await asyncio.gather(*[self._summarize_openai_batch(b) for b in batches], return_exceptions=True)
+        for batch, answer in zip(batches, answered):
+            if isinstance(answer, Exception):
+                # Left unanswered, so the documents get single calls below
+                logger.warning(f"Batched summarization failed, falling back to single calls: {str(answer)}")
+                continue
+            for i, result in answer.items():
+                results[i] = result
+                await llm_cache.set(llm_cache_key('summary', self, contents[i]), result)
+        
+        # Anything the batch did not answer is summarized on its own
+        missing = [i for i, result in enumerate(results) if result is None]
+        fallback = await self.summarize_many([contents[i] for i in missing])
+        for i, result in zip(missing, fallback):
+            results[i] = result
+        
+        return results
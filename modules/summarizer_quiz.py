@@ -0,0 +1,321 @@
+import asyncio
+import orjson
+import logging
+from typing_extensions import TypedDict
+from config import config
+from modules.cache import CachedLLM, llm_cache, llm_cache_key
+from modules.clients import get_openai_client
+from modules.quiz_generator import QuizQuestion, openai_response_format
+from modules.summarizer import fit_google_input, fit_openai_input, llm_retry
+
+logger = logging.getLogger(__name__)
+
+class SummaryQuiz(TypedDict):
+    """Structured-output schema for the combined summary + quiz response"""
+    summary: str
+    questions: list[QuizQuestion]
+
+# Static instructions, sent as the system prompt so the provider can cache the prefix;
+# only the content changes between calls
+SUMMARY_QUIZ_INSTRUCTIONS = """You are an expert summarizer and quiz generator for educational content.
+Read the content you are given and return ONLY a valid JSON object with two fields:
+
+"summary": a concise summary in 150-200 words only, focused on the 3-5 most
+important key points and suitable for educational purposes.
+
+"questions": {num_questions} educational quiz questions grounded in the content.
+Each question has "id" (1..{num_questions}), "question", "type" (one of
+"multiple_choice", "true_false", "fill_blank"), "options" (4 choices for
+multiple_choice, otherwise an empty list), "correct_answer" (for true_false
+use "true" or "false"; for fill_blank put _____ in the question) and "explanation".
+"""
+
+class SummaryQuizGenerator:
+    """Generates the summary and the quiz in a single LLM call, sending the content once"""
+    
+    def __init__(self, model_type='google', model_name=None):
+        self.model_type = model_type
+        self.model_name = model_name or (config.GEMINI_MODEL if model_type == 'google' else config.OPENAI_MODEL)
+        self.num_questions = config.NUM_QUIZ_QUESTIONS
+        self.instructions = SUMMARY_QUIZ_INSTRUCTIONS.format(num_questions=self.num_questions)
+        
+        # Provider SDKs are heavy; import only the one in use
+        if model_type == 'google':
+            import google.generativeai as genai
+            genai.configure(api_key=config.GOOGLE_API_KEY)
+            self.model = genai.GenerativeModel(
+                self.model_name,
+                system_instruction=self.instructions,
+                generation_config={
+                    'response_mime_type': 'application/json',
+                    'response_schema': SummaryQuiz
+                }
+            )
+        elif model_type == 'openai':
+            self.client = get_openai_client()
+    
+    @staticmethod
+    def build_prompt(content):
+        """The per-call part of the prompt: just the document"""
+        return f"CONTENT:\n{content}"
+    
+    async def fit_input(self, content):
+        """Trim content to the same per-provider token budget the summarizer uses"""
+        if self.model_type == 'google':
+            return await fit_google_input(self.model, content, config.SUMMARY_MAX_INPUT_TOKENS)
+        return await asyncio.to_thread(fit_openai_input, self.model_name, content, config.OPENAI_SUMMARY_MAX_INPUT_TOKENS)
+    
+    @llm_retry
+    async def _call_google(self, content):
+        return await self.model.generate_content_async(self.build_prompt(content))
+    
+    @llm_retry
+    async def _call_openai(self, content):
+        return await self.client.chat.completions.create(**self.openai_request(content))
+    
+    def openai_request(self, content):
+        """Chat completion parameters, shared by the live call and the Batch API"""
+        return {
+            "model": self.model_name,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": self.instructions
+                },
+                {
+                    "role": "user",
+                    "content": self.build_prompt(content)
+                }
+            ],
+            "response_format": openai_response_format('summary_quiz', SummaryQuiz),
+            "temperature": 0.7,
+            "max_tokens": 1500
+        }
+    
+    async def generate_both_with_google(self, content):
+        """Summary + quiz using Google Gemini structured output"""
+        try:
+            response = await self._call_google(await self.fit_input(content))
+            data = orjson.loads(response.text)
+            
+            logger.info(f"Summary and quiz generated successfully with {self.model_name}")
+            return {
+                'status': 'success',
+                'summary': data.get('summary', ''),
+                'quiz': data.get('questions', []),
+                'model': f'google-{self.model_name}'
+            }
+        
+        except orjson.JSONDecodeError as e:
+            logger.error(f"JSON parse error in summary + quiz generation: {str(e)}")
+            return {
+                'status': 'error',
+                'message': 'Failed to parse summary and quiz format'
+            }
+        except Exception as e:
+            logger.error(f"Error in Google summary + quiz generation: {str(e)}")
+            return {
+                'status': 'error',
+                'message': f"Summary and quiz generation failed: {str(e)}"
+            }
+    
+    async def generate_both_with_openai(self, content):
+        """Summary + quiz using OpenAI structured output"""
+        try:
+            response = await self._call_openai(await self.fit_input(content))
+            
+            data = orjson.loads(response.choices[0].message.content)
+            
+            logger.info(f"Summary and quiz generated successfully with {self.model_name}")
+            return {
+                'status': 'success',
+                'summary': data.get('summary', ''),
+                'quiz': data.get('questions', []),
+                'model': f'openai-{self.model_name}'
+            }
+        
+        except orjson.JSONDecodeError:
+            logger.error("JSON parse error in OpenAI summary + quiz generation")
+            return {
+                'status': 'error',
+                'message': 'Failed to parse summary and quiz format'
+            }
+        except Exception as e:
+            logger.error(f"Error in OpenAI summary + quiz generation: {str(e)}")
+            return {
+                'status': 'error',
+                'message': f"Summary and quiz generation failed: {str(e)}"
+            }
+    
+    @CachedLLM('summary_quiz')
+    async def generate_both(self, content):
+        """Main method: summary and quiz from one provider round trip"""
+        reason = self._rejects(content)
+        if reason:
+            return {
+                'status': 'error',
+                'message': reason
+            }
+        
+        if self.model_type == 'google':
+            return await self.generate_both_with_google(content)
+        elif self.model_type == 'openai':
+            return await self.generate_both_with_openai(content)
+        else:
+            return {
+                'status': 'error',
+                'message': 'Unknown model type'
+            }
+    
+    async def submit_batch(self, contents):
+        """
+        Offline pre-generation: queue summary + quiz requests on the OpenAI Batch API,
+        which completes within 24h at a lower price. Collect the results with
+        fetch_batch, passing the same contents (the extracted page text).
+        """
+        if self.model_type != 'openai':
+            return {
+                'status': 'error',
+                'message': 'Batch generation requires the openai model type'
+            }
+        
+        # Same input rules as the live path: reject short documents, trim long ones to budget
+        lines, rejected = [], []
+        for i, content in enumerate(contents):
+            reason = self._rejects(content)
+            if reason:
+                rejected.append({'index': i, 'message': reason})
+                continue
+            content = await asyncio.to_thread(
+                fit_openai_input, self.model_name, content[:config.MAX_SUMMARY_INPUT], config.OPENAI_SUMMARY_MAX_INPUT_TOKENS
+            )
+            lines.append(orjson.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self.openai_request(content)
+            }))
+        
+        if not lines:
+            return {
+                'status': 'error',
+                'message': 'No documents to submit',
+                'rejected': rejected
+            }
+        
+        try:
+            batch_file = await self.client.files.create(
+                file=('summary_quiz_batch.jsonl', b'\n'.join(lines)),
+                purpose='batch'
+            )
+            batch = await self.client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint='/v1/chat/completions',
+                completion_window='24h',
+                metadata={'count': str(len(contents))}
+            )
+            
+            logger.info(f"Submitted batch {batch.id} with {len(lines)} requests, {len(rejected)} rejected")
+            return {
+                'status': 'success',
+                'batch_id': batch.id,
+                'count': len(lines),
+                'rejected': rejected
+            }
+        
+        except Exception as e:
+            logger.error(f"Error submitting summary + quiz batch: {str(e)}")
+            return {
+                'status': 'error',
+                'message': f"Batch submission failed: {str(e)}"
+            }
+    
+    async def fetch_batch(self, batch_id, contents):
+        """
+        Results of a submitted batch, one per document in contents (the list passed to
+        submit_batch), once it has completed. Returns status 'pending' with the Batch API
+        status while it is still running. Successful results are written to the LLM cache
+        under generate_both's key, so /api/process-url serves them for the same pages.
+        """
+        try:
+            batch = await self.client.batches.retrieve(batch_id)
+            
+            if batch.status in ('validating', 'in_progress', 'finalizing'):
+                return {
+                    'status': 'pending',
+                    'batch_status': batch.status
+                }
+            if batch.status != 'completed':
+                return {
+                    'status': 'error',
+                    'message': f"Batch {batch.status}"
+                }
+            
+            output = await self.client.files.content(batch.output_file_id) if batch.output_file_id else None
+            
+            answers = {}
+            for line in (output.content.splitlines() if output else []):
+                item = orjson.loads(line)
+                answers[int(item['custom_id'])] = item
+            
+            count = int((batch.metadata or {}).get('count', len(contents)))
+            if count != len(contents):
+                return {
+                    'status': 'error',
+                    'message': f"Batch {batch_id} was submitted with {count} documents, got {len(contents)}"
+                }
+            
+            results = [
+                {'status': 'error', 'message': self._rejects(content)} if self._rejects(content)
+                else self._parse_batch_item(answers.get(i))
+                for i, content in enumerate(contents)
+            ]
+        
+        except Exception as e:
+            logger.error(f"Error fetching summary + quiz batch: {str(e)}")
+            return {
+                'status': 'error',
+                'message': f"Batch fetch failed: {str(e)}"
+            }
+        
+        # The live path calls generate_both(content[:MAX_SUMMARY_INPUT]); store under that key
+        for content, result in zip(contents, results):
+            if result['status'] == 'success':
+                await llm_cache.set(llm_cache_key('summary_quiz', self, content[:config.MAX_SUMMARY_INPUT]), result)
+        
+        logger.info(f"Fetched batch {batch_id}: {len(answers)} of {len(results)} answered")
+        return {
+            'status': 'success',
+            'results': results
+        }
+    
+    @staticmethod
+    def _rejects(content):
+        """Why generate_both would refuse this content, or None"""
+        if not content or len(content) < 100:
+            return 'Content too short for summarization'
+        return None
+    
+    def _parse_batch_item(self, item):
+        """Turn one Batch API output line into a generate_both-style result"""
+        response = (item or {}).get('response') or {}
+        if response.get('status_code') != 200:
+            return {
+                'status': 'error',
+                'message': f"Summary and quiz generation failed: {(item or {}).get('error') or 'no response'}"
+            }
+        
+        try:
+            data = orjson.loads(response['body']['choices'][0]['message']['content'])
+        except (orjson.JSONDecodeError, KeyError, IndexError, TypeError):
+            return {
+                'status': 'error',
+                'message': 'Failed to parse summary and quiz format'
+            }
+        
+        return {
+            'status': 'success',
+            'summary': data.get('summary', ''),
+            'quiz': data.get('questions', []),
+            'model': f'openai-{self.model_name}'
+        }
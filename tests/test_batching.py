@@ -0,0 +1,141 @@
+import asyncio
+import pytest
+from modules.batching import MicroBatcher
+from modules.quiz_generator import BatchingQuizGenerator, QuizGenerator
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def recording_handler(batches, transform=lambda item: item * 10):
+    async def handler(items):
+        batches.append(list(items))
+        return [transform(item) for item in items]
+    return handler
+
+
+def test_flushes_when_batch_is_full():
+    batches = []
+
+    async def scenario():
+        batcher = MicroBatcher(recording_handler(batches), window_ms=10000, max_batch_size=3)
+        # A full batch must not wait out the 10s window
+        return await asyncio.wait_for(asyncio.gather(*[batcher.submit(i) for i in range(3)]), 1)
+
+    assert run(scenario()) == [0, 10, 20]
+    assert batches == [[0, 1, 2]]
+
+
+def test_flushes_when_window_closes():
+    batches = []
+
+    async def scenario():
+        batcher = MicroBatcher(recording_handler(batches), window_ms=20, max_batch_size=10)
+        first = await asyncio.gather(batcher.submit(1), batcher.submit(2))
+        second = await batcher.submit(3)
+        return first, second
+
+    assert run(scenario()) == ([10, 20], 30)
+    assert batches == [[1, 2], [3]]
+
+
+def test_splits_at_max_batch_size():
+    batches = []
+
+    async def scenario():
+        batcher = MicroBatcher(recording_handler(batches), window_ms=20, max_batch_size=2)
+        return await asyncio.gather(*[batcher.submit(i) for i in range(5)])
+
+    assert run(scenario()) == [0, 10, 20, 30, 40]
+    assert batches == [[0, 1], [2, 3], [4]]
+
+
+def test_handler_exception_reaches_every_caller():
+    async def failing(items):
+        raise RuntimeError('upstream down')
+
+    async def scenario():
+        batcher = MicroBatcher(failing, window_ms=20, max_batch_size=10)
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+    results = run(scenario())
+    assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+
+
+def test_exception_result_only_reaches_its_caller():
+    async def handler(items):
+        return [ValueError(f"bad {item}") if item == 'bad' else item.upper() for item in items]
+
+    async def scenario():
+        batcher = MicroBatcher(handler, window_ms=20, max_batch_size=10)
+        return await asyncio.gather(batcher.submit('ok'), batcher.submit('bad'), return_exceptions=True)
+
+    ok, bad = run(scenario())
+    assert ok == 'OK'
+    assert isinstance(bad, ValueError)
+
+
+def test_short_result_list_fails_the_batch_instead_of_hanging():
+    async def handler(items):
+        return items[:1]
+
+    async def scenario():
+        batcher = MicroBatcher(handler, window_ms=20, max_batch_size=10)
+        return await asyncio.wait_for(
+            asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True), 1
+        )
+
+    assert all(isinstance(r, ValueError) for r in run(scenario()))
+
+
+@pytest.fixture
+def quiz_generator(monkeypatch):
+    singles = []
+
+    async def single(self, summary, content):
+        singles.append((summary, content))
+        return {'status': 'success', 'quiz': [summary], 'model': 'single'}
+
+    monkeypatch.setattr(QuizGenerator, '_generate', single)
+    generator = BatchingQuizGenerator(model_type='none', window_ms=20, max_batch_size=8)
+    generator.singles = singles
+    return generator
+
+
+def test_quiz_requests_in_one_window_share_a_call(quiz_generator):
+    calls = []
+
+    async def generate_batch(documents):
+        calls.append(documents)
+        return [{'status': 'success', 'quiz': [summary], 'model': 'batch'} for summary, _ in documents]
+
+    quiz_generator._generate_batch = generate_batch
+
+    async def scenario():
+        return await asyncio.gather(*[quiz_generator._generate(f"s{i}", f"c{i}") for i in range(3)])
+
+    results = run(scenario())
+    assert [r['quiz'] for r in results] == [['s0'], ['s1'], ['s2']]
+    assert calls == [[('s0', 'c0'), ('s1', 'c1'), ('s2', 'c2')]]
+    assert quiz_generator.singles == []
+
+
+def test_lone_quiz_request_uses_the_single_call(quiz_generator):
+    result = run(quiz_generator._generate('s', 'c'))
+    assert result['model'] == 'single'
+    assert quiz_generator.singles == [('s', 'c')]
+
+
+def test_failed_quiz_batch_returns_an_error_to_each_caller(quiz_generator):
+    async def generate_batch(documents):
+        raise RuntimeError('rate limited')
+
+    quiz_generator._generate_batch = generate_batch
+
+    async def scenario():
+        return await asyncio.gather(quiz_generator._generate('a', 'a'), quiz_generator._generate('b', 'b'))
+
+    results = run(scenario())
+    assert [r['status'] for r in results] == ['error', 'error']
+    assert 'rate limited' in results[0]['message']
@@ -0,0 +1,157 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+import pytest
+from modules import cache
+from modules import summarizer as summarizer_module
+from modules.cache import LLMCache
+from modules.summarizer import LLMSummarizer
+
+
+@pytest.fixture
+def summarizer(monkeypatch):
+    # Fresh in-memory cache, so only single-flight can deduplicate calls
+    monkeypatch.setattr(cache, 'llm_cache', LLMCache())
+    summarizer = LLMSummarizer(model_type='none')
+    summarizer.calls = []
+
+    async def slow_summarize(content):
+        summarizer.calls.append(content)
+        await asyncio.sleep(0.05)
+        return {'status': 'success', 'summary': content[:10], 'model': 'test'}
+
+    summarizer._summarize = slow_summarize
+    return summarizer
+
+
+def document():
+    return f"{uuid.uuid4()} " + 'x' * 200
+
+
+def test_identical_concurrent_requests_share_one_call(summarizer):
+    content = document()
+
+    async def scenario():
+        return await asyncio.gather(*[summarizer.summarize(content) for _ in range(5)])
+
+    results = asyncio.run(scenario())
+
+    assert summarizer.calls == [content]
+    assert all(r == results[0] for r in results)
+    assert summarizer._inflight == {}
+
+
+def test_different_content_is_not_shared(summarizer):
+    first, second = document(), document()
+
+    async def scenario():
+        return await asyncio.gather(summarizer.summarize(first), summarizer.summarize(second))
+
+    asyncio.run(scenario())
+
+    assert sorted(summarizer.calls) == sorted([first, second])
+
+
+def test_cancelled_caller_does_not_cancel_the_others(summarizer):
+    content = document()
+
+    async def scenario():
+        leaving = asyncio.create_task(summarizer.summarize(content))
+        staying = asyncio.create_task(summarizer.summarize(content))
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+        return await staying
+
+    result = asyncio.run(scenario())
+
+    assert result['status'] == 'success'
+    assert summarizer.calls == [content]
+
+
+def test_exception_reaches_every_waiter(summarizer):
+    async def failing(content):
+        summarizer.calls.append(content)
+        await asyncio.sleep(0.05)
+        raise RuntimeError('provider down')
+
+    summarizer._summarize = failing
+    content = document()
+
+    async def scenario():
+        return await asyncio.gather(*[summarizer.summarize(content) for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(scenario())
+
+    assert len(summarizer.calls) == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def gemini_chunk(text=None, finish_reason='FINISH_REASON_UNSPECIFIED', block_reason=None):
+    """Minimal stand-in for a streamed GenerateContentResponse chunk"""
+    feedback = SimpleNamespace(block_reason=SimpleNamespace(name=block_reason) if block_reason else None)
+    if block_reason:
+        return SimpleNamespace(candidates=[], prompt_feedback=feedback)
+    candidate = SimpleNamespace(
+        content=SimpleNamespace(parts=[text] if text else []),
+        finish_reason=SimpleNamespace(name=finish_reason)
+    )
+    return SimpleNamespace(candidates=[candidate], prompt_feedback=feedback, text=text)
+
+
+def stream_google(chunks):
+    summarizer = LLMSummarizer(model_type='none')
+
+    async def call_google(content):
+        async def response():
+            for chunk in chunks:
+                yield chunk
+        return response()
+
+    summarizer._call_google = call_google
+
+    async def scenario():
+        return [text async for text in summarizer._stream_google('content')]
+
+    return asyncio.run(scenario())
+
+
+def test_gemini_stream_skips_a_closing_chunk_without_parts():
+    chunks = [gemini_chunk('Hello '), gemini_chunk('world'), gemini_chunk(finish_reason='STOP')]
+    assert stream_google(chunks) == ['Hello ', 'world']
+
+
+def test_gemini_stream_raises_on_a_safety_stop():
+    with pytest.raises(ValueError, match='SAFETY'):
+        stream_google([gemini_chunk('Hello '), gemini_chunk(finish_reason='SAFETY')])
+
+
+def test_gemini_stream_raises_on_a_blocked_prompt():
+    with pytest.raises(ValueError, match='OTHER'):
+        stream_google([gemini_chunk(block_reason='OTHER')])
+
+
+class ByteEncoding:
+    """Worst case for byte-level BPE: one token per UTF-8 byte"""
+
+    @staticmethod
+    def encode(text):
+        return list(text.encode('utf-8'))
+
+    @staticmethod
+    def decode(tokens):
+        return bytes(tokens).decode('utf-8', errors='ignore')
+
+
+def test_openai_budget_counts_multibyte_characters(monkeypatch):
+    monkeypatch.setattr(summarizer_module, 'get_encoding', lambda model_name: ByteEncoding)
+
+    # 100 characters, 400 tokens: shorter than the budget in characters, but not in tokens
+    fitted = summarizer_module.fit_openai_input('gpt-4o-mini', '🎉' * 100, 200)
+
+    assert len(ByteEncoding.encode(fitted)) <= 200
+    assert fitted == '🎉' * 50
+
+
+def test_openai_budget_leaves_short_content_alone(monkeypatch):
+    monkeypatch.setattr(summarizer_module, 'get_encoding', lambda model_name: ByteEncoding)
+    assert summarizer_module.fit_openai_input('gpt-4o-mini', 'short text', 200) == 'short text'
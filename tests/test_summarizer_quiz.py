@@ -0,0 +1,109 @@
+import asyncio
+import orjson
+import pytest
+from types import SimpleNamespace
+from modules import cache
+from modules.cache import LLMCache, llm_cache_key
+from modules import summarizer_quiz
+from modules.summarizer_quiz import SummaryQuizGenerator
+
+
+class FakeBatchAPI:
+    """Files + batches endpoints that answer every submitted request, optionally with extra output lines"""
+
+    def __init__(self, extra_lines=()):
+        self.submitted = None
+        self.metadata = None
+        self.extra_lines = list(extra_lines)
+        self.files = SimpleNamespace(create=self._upload, content=self._output)
+        self.batches = SimpleNamespace(create=self._create, retrieve=self._retrieve)
+
+    async def _upload(self, file, purpose):
+        self.submitted = [orjson.loads(line) for line in file[1].splitlines()]
+        return SimpleNamespace(id='file-in')
+
+    async def _create(self, input_file_id, endpoint, completion_window, metadata):
+        self.metadata = metadata
+        return SimpleNamespace(id='batch-1')
+
+    async def _retrieve(self, batch_id):
+        return SimpleNamespace(status='completed', output_file_id='file-out', metadata=self.metadata,
+                               request_counts=SimpleNamespace(total=len(self.submitted)))
+
+    async def _output(self, file_id):
+        lines = [
+            orjson.dumps({
+                'custom_id': request['custom_id'],
+                'response': {
+                    'status_code': 200,
+                    'body': {'choices': [{'message': {'content': orjson.dumps({
+                        'summary': f"summary {request['custom_id']}",
+                        'questions': []
+                    }).decode()}}]}
+                },
+                'error': None
+            })
+            for request in self.submitted
+        ]
+        return SimpleNamespace(content=b'\n'.join(lines + self.extra_lines))
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    fresh_cache = LLMCache()
+    monkeypatch.setattr(cache, 'llm_cache', fresh_cache)
+    monkeypatch.setattr(summarizer_quiz, 'llm_cache', fresh_cache)
+    generator = SummaryQuizGenerator(model_type='none')
+    generator.model_type = 'openai'
+    generator.client = FakeBatchAPI()
+    return generator
+
+
+def test_batch_round_trip_keeps_order_and_rejections(generator):
+    contents = ['a' * 200, 'too short', 'b' * 200]
+
+    async def scenario():
+        submitted = await generator.submit_batch(contents)
+        fetched = await generator.fetch_batch(submitted['batch_id'], contents)
+        return submitted, fetched
+
+    submitted, fetched = asyncio.run(scenario())
+
+    assert [r['custom_id'] for r in generator.client.submitted] == ['0', '2']
+    assert submitted['rejected'] == [{'index': 1, 'message': 'Content too short for summarization'}]
+    assert [r.get('summary') for r in fetched['results']] == ['summary 0', None, 'summary 2']
+    assert fetched['results'][1] == {'status': 'error', 'message': 'Content too short for summarization'}
+
+
+def test_fetched_results_are_served_by_generate_both(generator):
+    contents = ['a' * 200]
+
+    async def scenario():
+        submitted = await generator.submit_batch(contents)
+        await generator.fetch_batch(submitted['batch_id'], contents)
+        # No provider is configured, so only a cache hit can succeed
+        return await generator.generate_both(contents[0])
+
+    result = asyncio.run(scenario())
+
+    assert result['summary'] == 'summary 0'
+    assert asyncio.run(cache.llm_cache.get(llm_cache_key('summary_quiz', generator, contents[0]))) == result
+
+
+def test_malformed_output_returns_an_error(generator):
+    generator.client = FakeBatchAPI(extra_lines=[b'{not json'])
+    contents = ['a' * 200]
+
+    async def scenario():
+        submitted = await generator.submit_batch(contents)
+        return await generator.fetch_batch(submitted['batch_id'], contents)
+
+    assert asyncio.run(scenario())['status'] == 'error'
+
+
+def test_mismatched_contents_are_refused(generator):
+    async def scenario():
+        submitted = await generator.submit_batch(['a' * 200, 'b' * 200])
+        return await generator.fetch_batch(submitted['batch_id'], ['a' * 200])
+
+    assert asyncio.run(scenario())['status'] == 'error'
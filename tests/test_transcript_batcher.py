@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from modules import scraper
+from modules.scraper import YoutubeTranscriptBatcher
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self._data = data
+        self.text = '' if data is not None else 'error'
+
+    def json(self):
+        return self._data
+
+
+class FakeClient:
+    """Answers POSTs from a callable of the requested IDs, recording each request"""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+
+    async def post(self, url, headers=None, json=None):
+        self.requests.append(json['ids'])
+        return self.respond(json['ids'])
+
+
+@pytest.fixture
+def api(monkeypatch):
+    def install(respond):
+        client = FakeClient(respond)
+        monkeypatch.setattr(scraper.WebScraper, 'get_api_client', staticmethod(lambda: client))
+        return client
+    return install
+
+
+def fetch_all(video_ids, max_batch_size=10):
+    async def scenario():
+        batcher = YoutubeTranscriptBatcher(window_ms=20, max_batch_size=max_batch_size)
+        return await asyncio.gather(*[batcher.fetch(video_id) for video_id in video_ids], return_exceptions=True)
+    return asyncio.run(scenario())
+
+
+def test_one_request_per_window_matched_by_id(api):
+    # The API answers in a different order than requested
+    client = api(lambda ids: FakeResponse(200, [{'id': i, 'text': i.upper()} for i in reversed(ids)]))
+
+    results = fetch_all(['a', 'b', 'c'])
+
+    assert client.requests == [['a', 'b', 'c']]
+    assert [item['text'] for _, item in results] == ['A', 'B', 'C']
+
+
+def test_duplicate_ids_are_requested_once(api):
+    client = api(lambda ids: FakeResponse(200, [{'id': i} for i in ids]))
+
+    results = fetch_all(['a', 'a', 'b'])
+
+    assert client.requests == [['a', 'b']]
+    assert [item['id'] for _, item in results] == ['a', 'a', 'b']
+
+
+def test_missing_item_resolves_to_none(api):
+    api(lambda ids: FakeResponse(200, [{'id': 'a'}]))
+
+    results = fetch_all(['a', 'b'])
+
+    assert results[0] == (200, {'id': 'a'})
+    assert results[1] == (200, None)
+
+
+def test_items_without_ids_follow_request_order(api):
+    api(lambda ids: FakeResponse(200, [{'text': i} for i in ids]))
+
+    results = fetch_all(['a', 'b'])
+
+    assert [item['text'] for _, item in results] == ['a', 'b']
+
+
+def test_bad_id_only_fails_its_own_caller(api):
+    def respond(ids):
+        if 'bad' in ids:
+            return FakeResponse(404)
+        return FakeResponse(200, [{'id': i} for i in ids])
+
+    client = api(respond)
+
+    results = fetch_all(['a', 'bad', 'b'])
+
+    assert client.requests[0] == ['a', 'bad', 'b']
+    assert sorted(client.requests[1:]) == [['a'], ['b'], ['bad']]
+    assert results == [(200, {'id': 'a'}), (404, None), (200, {'id': 'b'})]
+
+
+def test_request_wide_errors_are_not_retried_per_id(api):
+    client = api(lambda ids: FakeResponse(429))
+
+    results = fetch_all(['a', 'b'])
+
+    assert client.requests == [['a', 'b']]
+    assert results == [(429, None), (429, None)]
+
+
+def test_transport_error_reaches_every_caller(api):
+    def respond(ids):
+        raise ConnectionError('reset')
+
+    api(respond)
+
+    results = fetch_all(['a', 'b'])
+
+    assert all(isinstance(r, ConnectionError) for r in results)